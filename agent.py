@@ -1,5 +1,7 @@
 import json
+import os
 import asyncio
+import logging
 import utils
 from typing import Any, List, Type, Union
 from pydantic import BaseModel
@@ -13,6 +15,16 @@ from json_parser import from_str
 
 load_dotenv()
 
+# set AGENT_LOG_LEVEL=DEBUG to see the full prompt and raw model response each turn
+# (only this logger: the root logger and library loggers such as httpx keep their defaults)
+log = logging.getLogger("agent")
+log.setLevel(os.getenv("AGENT_LOG_LEVEL", "INFO").upper())
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter("%(message)s"))
+log.addHandler(_log_handler)
+log.propagate = False
+_RULE = "*" * 50
+
 
 Number = Union[int, float]
 
@@ -40,31 +52,59 @@ class DoneForNow(BaseModel):
     message: str
 
 
-TOOL_MODELS: List[Type[BaseModel]] = [Divide, Add, DoneForNow, Multiply]
+# lets the model send several independent tool calls in one round-trip
+class Batch(BaseModel):
+    reasoning: str
+    intent: Literal["batch"] = "batch"
+    actions: List[Union[Divide, Add, Multiply]]
+
+
+TOOL_MODELS: List[Type[BaseModel]] = [Divide, Add, DoneForNow, Multiply, Batch]
 
 
 SCHEMA_BLOCK = "\nor\n".join(utils.snippet(m) for m in TOOL_MODELS)
 
+# request metadata is identical every turn, so build it once
+_REQ_PARAMS = ModelRequestParameters(output_mode="prompted")
+_SYSTEM_PART = SystemPromptPart(content="You are Asisstant")
+
 class Event:
+    __slots__ = ("type", "data", "_dict")
+
     def __init__(self, type: str, data: Any):
         self.type = type
         self.data = data
+        self._dict = None
 
     def as_dict(self) -> dict:
-        return {"type": self.type, "data": self.data}
+        # events are never mutated after construction, so build the dict once
+        if self._dict is None:
+            self._dict = {"type": self.type, "data": self.data}
+        return self._dict
 
 class Thread:
     def __init__(self, events: List[Event]):
         self.events = events
+        # each event is serialized once, when it is added, instead of re-dumping
+        # the whole history on every turn
+        self._cache: List[str] = [self._dump(e) for e in events]
+
+    @staticmethod
+    def _dump(event: Event) -> str:
+        # ensure_ascii=False keeps non-ASCII characters readable in the prompt
+        return json.dumps(event.as_dict(), separators=(",", ":"), ensure_ascii=False)
+
+    def add_event(self, event: Event) -> None:
+        self.events.append(event)
+        self._cache.append(self._dump(event))
 
     def serialize_for_llm(self) -> str:
         # change this to XML or your own format if you prefer
-        return json.dumps([e.as_dict() for e in self.events], indent=2)
-
-def _build_prompt(thread: Thread) -> str:
-    return f"""You are working on the following thread:
+        return "[\n" + ",\n".join(self._cache) + "\n]"
 
-{thread.serialize_for_llm()}
+# the prompt around the thread never changes, so only the middle is rebuilt per turn
+_PROMPT_PREFIX = "You are working on the following thread:\n\n"
+_PROMPT_SUFFIX = f"""
 
 What should the next step be?
 
@@ -72,62 +112,79 @@ Answer in JSON using any of these schemas:
 {SCHEMA_BLOCK}
 """
 
+def _build_prompt(thread: Thread) -> str:
+    return _PROMPT_PREFIX + thread.serialize_for_llm() + _PROMPT_SUFFIX
+
 thread = Thread([])
 
+def _do_divide(action: dict) -> Number:
+    return action["numerator"] / action["denominator"]
+
+def _do_add(action: dict) -> Number:
+    return action["a"] + action["b"]
+
+def _do_multiply(action: dict) -> Number:
+    return action["a"] * action["b"]
+
+# intent -> handler; adding a tool is one entry here plus its model above
+_TOOLS = {"divide": _do_divide, "add": _do_add, "multiply": _do_multiply}
+
+def _run_tool(action: dict):
+    if not isinstance(action, dict):
+        thread.add_event(Event(type="probable_assistant_mistake", data={"error_message": "Unexpected format, expected an action object"}))
+        return
+    intent = action.get("intent")
+    handler = _TOOLS.get(intent)
+    if handler is None:
+        thread.add_event(Event(type="probable_system_error", data={"error_message": "This intent is not handled in the code"}))
+    else:
+        thread.add_event(Event(type="tool_result", data={"tool": intent, "result": handler(action)}))
+
 async def agent_loop():
     while True:
         prompt = _build_prompt(thread)
-        print("The thread that is getting sent to the model in the user prompt literally:\n")
-        print("*"*50)
-        print(prompt)
-        print("*"*50)
+        log.debug("The thread that is getting sent to the model in the user prompt literally:\n\n%s\n%s\n%s", _RULE, prompt, _RULE)
 
         resp = await model_request(
             "openai:gpt-4.1",
-            [ModelRequest(parts=[SystemPromptPart(content="You are Asisstant"), UserPromptPart(content=prompt)])],
-            model_request_parameters=ModelRequestParameters(output_mode="prompted"),
+            [ModelRequest(parts=[_SYSTEM_PART, UserPromptPart(content=prompt)])],
+            model_request_parameters=_REQ_PARAMS,
         )
         
-        print("the model's full response response (before we parse and handle it): ")
-        print("*"*50)
-        print(resp.parts[0].content)
-        print("*"*50)
+        log.debug("the model's full response (before we parse and handle it):\n%s\n%s\n%s", _RULE, resp.parts[0].content, _RULE)
 
         data = from_str(resp.parts[0].content)
 
-        thread.events.append(Event(type="assistant_action", data=data))
+        thread.add_event(Event(type="assistant_action", data=data))
     
         if "intent" in data:
             if data["intent"] == "done_for_now":
                 return data["message"]
-            
-            elif data["intent"] == "divide":
-                result = data["numerator"] / data["denominator"]
-                thread.events.append(Event(type="tool_result", data={"tool": "divide", "result": result}))
-
-            elif data["intent"] == "add":
-                result = data["a"] + data["b"]
-                thread.events.append(Event(type="tool_result", data={"tool": "add", "result": result}))
 
-            elif data["intent"] == "multiply":
-                result = data["a"] * data["b"]
-                thread.events.append(Event(type="tool_result", data={"tool": "multiply", "result": result}))
+            elif data["intent"] == "batch":
+                actions = data.get("actions")
+                if not isinstance(actions, list):
+                    thread.add_event(Event(type="probable_assistant_mistake", data={"error_message": "Unexpected format, batch actions must be a list"}))
+                    continue
+                # run every action locally before going back to the model
+                for action in actions:
+                    _run_tool(action)
 
             else:
-                thread.events.append(Event(type="probable_system_error", data={"error_message": "This intent is not handled in the code"}))
+                _run_tool(data)
                 
         else:
-            thread.events.append(Event(type="probable_assistant_mistake", data={"error_message": "Unexpected format, missing intent"}))
+            thread.add_event(Event(type="probable_assistant_mistake", data={"error_message": "Unexpected format, missing intent"}))
 
 
 async def main():
-    thread.events.append(Event("start_of_conversation", "This is event 0. your cue to start the conversation with the user using the done_for_now to communicate with the user."))
+    thread.add_event(Event("start_of_conversation", "This is event 0. your cue to start the conversation with the user using the done_for_now to communicate with the user."))
     result = await agent_loop()
     print(result)
 
     while True:
         human_query = input()
-        thread.events.append(Event("user_input", human_query))
+        thread.add_event(Event("user_input", human_query))
         result = await agent_loop()
         print(result)
 
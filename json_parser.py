@@ -1,13 +1,51 @@
 
+import copy
 import json
 import re
-from enum import Enum
-from typing import Any
-
-class ParseState(Enum):
-    NORMAL = "normal"
-    IN_STRING = "in_string"
-    ESCAPE = "escape"
+from functools import lru_cache
+from typing import Any, Iterator
+
+__all__ = ["from_str", "reset_parser_cache"]
+
+# raw_decode parses a value starting at an offset, ignoring what follows
+_DECODER = json.JSONDecoder()
+
+# First characters a JSON document can start with (including NaN/Infinity, which
+# json.loads accepts); anything else skips the plain json.loads attempt and the
+# exception it would raise
+_JSON_START = frozenset('{["tfnNI-0123456789')
+
+# Inputs longer than this skip the from_str and _fix_malformed_json caches, so
+# a few huge responses can't pin large strings in memory
+_REPAIR_CACHE_MAX_LEN = 4096
+
+_RE_DOT_NUM = re.compile(r"(?<=[:\s\[,])\.(\d+)")
+_RE_SINGLE_STR = re.compile(r"'([^'\\]*(?:\\.[^'\\]*)*)'")
+# Unquoted key before a ':' | any value after ':' until a comma or closing bracket/brace.
+# Values that open an object/array are not consumed, so keys and values nested
+# inside them are still visited by the same pass.
+_RE_KEY_VALUE = re.compile(
+    r'(?P<kpref>[{,]\s*)(?P<key>[A-Za-z_][A-Za-z0-9_]*)(?=\s*:)'
+    r'|(?P<vpref>:\s*)(?P<val>[^\s,\}\]\{\[][^,\}\]]*?|\s)(?=\s*[,\}\]]|$)'
+)
+# Bareword value -> JSON text. Python True/False/None become JSON literals;
+# uppercase TRUE/FALSE are kept as strings rather than booleans.
+_LITERAL_VALUES = {
+    "true": "true", "false": "false", "null": "null",
+    "True": "true", "False": "false", "None": "null",
+    "TRUE": '"TRUE"', "FALSE": '"FALSE"',
+}
+_RE_NUM = re.compile(r"-?\d+(\.\d+)?([eE][+\-]?\d+)?")
+_RE_STRUCTURAL = re.compile(r'[\\"{}\[\]]')
+_RE_STRING_SPECIAL = re.compile(r'[\\"]')
+_RE_COMMENT_OR_QUOTE = re.compile(r'"|//|/\*')
+_RE_TRAIL_COMMA = re.compile(r",\s*([\}\]])")
+_RE_LEAD_COMMA = re.compile(r"([\{\[])\s*,\s*")
+# Text allowed after an opening ``` fence (a language tag such as "json")
+_RE_FENCE_TAG = re.compile(r"[\w \t\r]*")
+# Deletes every Latin-1 character except brackets; anything else left over is
+# ignored by the balancing loop anyway
+_BRACKETS_ONLY = str.maketrans("", "", "".join(chr(i) for i in range(256) if chr(i) not in "{}[]"))
 
 def from_str(input_str: str) -> Any:
     """
@@ -21,22 +59,39 @@ def from_str(input_str: str) -> Any:
       - If the whole payload is a quoted JSON blob, unquote+unescape then parse
       - Quote complex expression-like values (e.g., 314.97 + 1.32)
     """
-    if not input_str or not input_str.strip():
+    raw = input_str.strip() if input_str else ""
+    if not raw:
         return None
-    raw = input_str.strip()
+
+    # Fast path: plain JSON is by far the most common LLM output, so try it
+    # before any heuristics. Quoted payloads skip this and go through Strategy 0
+    # first, so a JSON-encoded object string still gets unwrapped into an object.
+    quote = raw[0]
+    if quote not in ('"', "'") and quote in _JSON_START:
+        try:
+            return json.loads(raw)
+        except json.JSONDecodeError:
+            pass
+
+    # The repair heuristics cost far more than a cache lookup, and models often
+    # repeat the same malformed output, so short inputs are memoized.
+    # Results are copied on the way out since callers may mutate them.
+    if len(raw) <= _REPAIR_CACHE_MAX_LEN:
+        return copy.deepcopy(_repair_cached(raw))
+    return _repair(raw)
+
+def _repair(raw: str) -> Any:
+    """Run the repair strategies of from_str on stripped, non-empty input the plain parse rejected."""
+    quote = raw[0]
+    quoted = quote in ('"', "'")
 
     # Strategy 0: whole payload is quoted -> unquote + unescape + parse
-    # First check if the string after stripping whitespace starts and ends with quotes
-    stripped_for_quote_check = raw.strip()
-    if len(stripped_for_quote_check) >= 2 and stripped_for_quote_check[0] == stripped_for_quote_check[-1] and stripped_for_quote_check[0] in {'"', "'"}:
-        inner = stripped_for_quote_check[1:-1]
-        # Handle escaped quotes in the inner content
-        if stripped_for_quote_check[0] == '"':
-            inner = inner.replace('\\"', '"')
-        elif stripped_for_quote_check[0] == "'":
-            inner = inner.replace("\\'", "'")
-        inner = inner.strip()
-        if inner.startswith("{") or inner.startswith("["):
+    # (raw is already stripped, so just check it starts and ends with the same quote)
+    if quoted and len(raw) >= 2 and raw[-1] == quote:
+        # Handle escaped quotes in the inner content; the strip is still needed
+        # for payloads like '" {...} "'
+        inner = raw[1:-1].replace("\\" + quote, quote).strip()
+        if inner.startswith(("{", "[")):
             # Try to parse as-is first
             try:
                 return json.loads(inner)
@@ -51,17 +106,42 @@ def from_str(input_str: str) -> Any:
                     # print(f"Fixed JSON was: {fixed_inner}")
                     pass  # fall through
 
-    # Strategy 1: Try straightforward JSON parsing
-    try:
-        return json.loads(raw)
-    except json.JSONDecodeError:
-        pass
+    # Strategy 1: Try straightforward JSON parsing (already done above unless quoted;
+    # single-quoted payloads can never be valid JSON)
+    if quote == '"':
+        try:
+            return json.loads(raw)
+        except json.JSONDecodeError:
+            pass
+
+    # Strategy 1a: valid JSON apart from trailing commas, the most common slip --
+    # a single substitution is enough, no need for the full repair pipeline
+    if quote in "{[" and "," in raw:
+        try:
+            return json.loads(_RE_TRAIL_COMMA.sub(r"\1", raw))
+        except json.JSONDecodeError:
+            pass
+
+    # Strategy 1b: a single valid JSON object/array surrounded by prose.
+    # raw_decode parses from the first bracket and stops where the value ends,
+    # so no candidate extraction is needed. Only accept it when nothing before it
+    # is quoted, no other bracket follows and there are no markdown fences (a
+    # fenced reply may hold several blocks, which Strategy 2 collects); every
+    # other layout still goes through the strategies below.
+    brace, bracket = raw.find("{"), raw.find("[")
+    first = brace if bracket == -1 or (brace != -1 and brace < bracket) else bracket
+    if first != -1 and raw.find('"', 0, first) == -1 and "```" not in raw:
+        try:
+            obj, end = _DECODER.raw_decode(raw, first)
+        except json.JSONDecodeError:
+            pass
+        else:
+            if raw.find("{", end) == -1 and raw.find("[", end) == -1:
+                return obj
 
     # Strategy 2: Extract and parse all code-block JSON (```json ... ```)
-    md_pattern = r"```(?:\w*\s*)?\n(.*?)\n```"
-    md_blocks = re.findall(md_pattern, raw, flags=re.DOTALL)
     md_results = []
-    for blk in md_blocks:
+    for blk in _extract_markdown_blocks(raw):
         blk = blk.strip()
         try:
             md_results.append(json.loads(blk))
@@ -76,9 +156,8 @@ def from_str(input_str: str) -> Any:
         return md_results[0] if len(md_results) == 1 else md_results
 
     # Strategy 3: Find and parse all JSON objects/arrays in the text
-    objs = _extract_json_objects(raw)
     obj_results = []
-    for s in objs:
+    for s in _extract_json_objects(raw):
         try:
             obj_results.append(json.loads(s))
             continue
@@ -92,50 +171,181 @@ def from_str(input_str: str) -> Any:
         return obj_results[0] if len(obj_results) == 1 else obj_results
 
     # Strategy 4: Fix malformed JSON on the entire input
+    # Without brackets, only comment removal and single-quote conversion can
+    # turn the text into JSON (a scalar such as 'hello' or 42 // answer); if
+    # neither applies the repair can't change the result, so skip it
+    if "{" not in raw and "[" not in raw and "'" not in raw and "/" not in raw:
+        return raw
     fixed = _fix_malformed_json(raw)
     try:
         return json.loads(fixed)
     except json.JSONDecodeError:
         return raw  # last resort: return original string
 
-def _extract_json_objects(text: str) -> list[str]:
-    """Find all balanced {...} and [...] substrings in text."""
-    results = []
+_repair_cached = lru_cache(maxsize=1024)(_repair)
+
+def _extract_markdown_blocks(text: str) -> list[str]:
+    """
+    Return the bodies of all ```...``` fenced blocks in text.
+    An opening fence must begin a line and be followed only by a plain tag
+    (e.g. "json"), so a ``` mentioned inside prose doesn't pair with the next
+    real fence. The body ends at the next newline followed by ```.
+    """
+    blocks = []
+    start = text.find("```")
+    while start != -1:
+        body = text.find("\n", start + 3)
+        if body == -1:
+            break
+        line = text.rfind("\n", 0, start) + 1
+        if text[line:start].strip() or not _RE_FENCE_TAG.fullmatch(text, start + 3, body):
+            start = text.find("```", start + 3)
+            continue
+        end = text.find("\n```", body)
+        if end == -1:
+            break
+        blocks.append(text[body + 1:end])
+        start = text.find("```", end + 4)
+    return blocks
+
+def _extract_json_objects(text: str) -> Iterator[str]:
+    """Yield all balanced {...} and [...] substrings in text, in order."""
     stack = []
+    push, pop = stack.append, stack.pop
+    search_structural = _RE_STRUCTURAL.search
+    search_string = _RE_STRING_SPECIAL.search
     start = None
     in_string = False
-    escape = False
-    for i, ch in enumerate(text):
-        if escape:
-            escape = False
-            continue
+    pos = 0
+    # Jump straight to the next character that can change the scanner state;
+    # the regex engine skips over everything else in C. Inside a string only
+    # quotes and backslashes matter, so brackets there aren't visited at all.
+    while True:
+        m = (search_string if in_string else search_structural)(text, pos)
+        if m is None:
+            break
+        i = m.start()
+        ch = text[i]
         if ch == "\\":
-            escape = True
+            pos = i + 2  # skip the escaped character
             continue
+        pos = i + 1
         if ch == '"':
             in_string = not in_string
             continue
-        if in_string:
-            continue
         if ch in "{[":
             if not stack:
                 start = i
-            stack.append(ch)
+            push(ch)
         elif ch in "}]":
             if stack:
-                open_br = stack.pop()
+                open_br = pop()
                 if (open_br == '{' and ch == '}') or (open_br == '[' and ch == ']'):
                     if not stack and start is not None:
-                        results.append(text[start:i+1])
+                        yield text[start:i+1]
                         start = None
                 else:
                     stack.clear()
                     start = None
     if stack and start is not None:
-        results.append(text[start:])
-    return results
+        yield text[start:]
+
+def _strip_comments(text: str) -> str:
+    """
+    Remove // line comments and /* */ block comments in a single pass.
+    Text inside double-quoted strings is left alone, and // right after a ':'
+    is kept so unquoted URLs (https://...) survive.
+    """
+    if "/" not in text:
+        return text
+    # Jump between comment starts / quotes with the regex engine and copy the
+    # spans in between wholesale, instead of stepping through every character.
+    out = []
+    append = out.append
+    find = text.find
+    search_string = _RE_STRING_SPECIAL.search
+    search_comment_or_quote = _RE_COMMENT_OR_QUOTE.search
+    n = len(text)
+    copy_from = 0
+    pos = 0
+    in_string = False
+    while True:
+        if in_string:
+            m = search_string(text, pos)
+            if m is None:
+                break
+            i = m.start()
+            if text[i] == "\\":
+                pos = i + 2  # skip the escaped character
+            else:
+                in_string = False
+                pos = i + 1
+            continue
+
+        m = search_comment_or_quote(text, pos)
+        if m is None:
+            break
+        i = m.start()
+        tok = m.group()
+        if tok == '"':
+            in_string = True
+            pos = i + 1
+        elif tok == "//" and i > 0 and text[i - 1] == ":":
+            pos = i + 1  # part of a URL, not a comment
+        elif tok == "//":
+            append(text[copy_from:i])
+            end = find("\n", i + 2)  # keep the newline itself
+            if end == -1:
+                copy_from = n  # comment runs to the end of the text
+                break
+            copy_from = pos = end
+        else:
+            end = find("*/", i + 2)
+            if end == -1:
+                # no closing */ -- not a comment (e.g. a glob like src/*.py), keep it
+                pos = i + 2
+                continue
+            append(text[copy_from:i])
+            copy_from = pos = end + 2
+    append(text[copy_from:])
+    return "".join(out)
+
+# Regex callbacks used by _fix_malformed_json, defined once at module level
+# rather than re-created on every call.
+def _convert_single(m: re.Match) -> str:
+    inner = m.group(1).replace('"', '\\"')
+    return '"' + inner + '"'
+
+def _quote_key_value(m: re.Match) -> str:
+    if m.lastgroup == "key":
+        return m.group("kpref") + '"' + m.group("key") + '"'
+
+    prefix, value = m.group("vpref"), m.group("val").strip()
+
+    # Skip if already quoted
+    if value.startswith(('"', "'")):
+        return prefix + m.group("val")
+
+    # JSON literals, Python True/False/None and uppercase TRUE/FALSE, in one lookup
+    literal = _LITERAL_VALUES.get(value)
+    if literal is not None:
+        return prefix + literal
+
+    # Numbers (including scientific notation)
+    if _RE_NUM.fullmatch(value):
+        return prefix + value
+
+    # Quote everything else (URLs, emails, expressions, etc.)
+    value = value.replace('"', '\\"')
+    return f'{prefix}"{value}"'
 
 def _fix_malformed_json(text: str) -> str:
+    """Repair ``text`` with _fix_json, memoized for inputs up to _REPAIR_CACHE_MAX_LEN."""
+    if len(text) <= _REPAIR_CACHE_MAX_LEN:
+        return _fix_json_cached(text)
+    return _fix_json(text)
+
+def _fix_json(text: str) -> str:
     """
     Repair common JSON issues:
       - remove comments
@@ -147,78 +357,46 @@ def _fix_malformed_json(text: str) -> str:
       - remove trailing/leading commas
       - balance braces/brackets with a stack
     """
-    # 1) Remove comments (but be careful about URLs with //)
-    # Only remove // comments if they're not part of a URL (no : before //)
-    text = re.sub(r"(?<!:)//.*?$", "", text, flags=re.MULTILINE)
-    text = re.sub(r"/\*.*?\*/", "", text, flags=re.DOTALL)
+    # 1) Remove comments (but be careful about URLs with // and string contents)
+    text = _strip_comments(text)
 
     # 2) Numbers starting with '.'
-    text = re.sub(r"(?<=[:\s\[,])\.(\d+)", r"0.\1", text)
+    text = _RE_DOT_NUM.sub(r"0.\1", text)
 
     # 3) Single-quoted strings -> double-quoted
-    def _convert_single(m: re.Match) -> str:
-        inner = m.group(1).replace('"', '\\"')
-        return '"' + inner + '"'
-    text = re.sub(r"'([^'\\]*(?:\\.[^'\\]*)*)'", _convert_single, text)
-
-    # 4) Quote unquoted keys
-    key_pattern = re.compile(r'([{,]\s*)([A-Za-z_][A-Za-z0-9_]*)(\s*:)')
-    text = key_pattern.sub(r'\1"\2"\3', text)
-
-    # 5) Quote unquoted values - improved regex approach
-    def _quote_value(m: re.Match) -> str:
-        prefix, value = m.group(1), m.group(2).strip()
-        
-        # Skip if already quoted or is object/array
-        if value.startswith(('"', "'", "{", "[")):
-            return prefix + m.group(2)
-        
-        # Special case for uppercase TRUE/FALSE (should be strings not booleans)
-        if value in {"TRUE", "FALSE"}:
-            return prefix + f'"{value}"'
-        
-        # Python True/False/None -> JSON true/false/null
-        if value == "True":
-            return prefix + "true"
-        elif value == "False":
-            return prefix + "false"
-        elif value == "None":
-            return prefix + "null"
-        
-        # JSON literals (lowercase)
-        if value in {"true", "false", "null"}:
-            return prefix + value
-        
-        # Numbers (including scientific notation)
-        if re.fullmatch(r"-?\d+(\.\d+)?([eE][+\-]?\d+)?", value):
-            return prefix + value
-        
-        # Quote everything else (URLs, emails, expressions, etc.)
-        value = value.replace('"', '\\"')
-        return f'{prefix}"{value}"'
-    
-    # Match any value after : until we hit a comma, closing bracket/brace
-    val_pattern = re.compile(r'(:\s*)([^,\}\]]+?)(?=\s*[,\}\]]|$)')
-    text = val_pattern.sub(_quote_value, text)
+    if "'" in text:
+        text = _RE_SINGLE_STR.sub(_convert_single, text)
+
+    # 4+5) Quote unquoted keys and values in a single pass
+    text = _RE_KEY_VALUE.sub(_quote_key_value, text)
 
     # 6) Remove dangling commas
-    text = re.sub(r",\s*([\}\]])", r"\1", text)
-    text = re.sub(r"([\{\[])\s*,\s*", r"\1", text)
+    text = _RE_TRAIL_COMMA.sub(r"\1", text)
+    text = _RE_LEAD_COMMA.sub(r"\1", text)
 
     # 7) Balance brackets with a stack
+    # (walk only the bracket characters; str.translate drops the rest in C)
+    # The stack holds the expected closers, so a closing bracket only needs one
+    # compare against the top; unmatched closers are ignored.
     stack = []
-    for ch in text:
+    push, pop = stack.append, stack.pop
+    for ch in text.translate(_BRACKETS_ONLY):
         if ch == '{':
-            stack.append('}')
+            push('}')
         elif ch == '[':
-            stack.append(']')
-        elif ch == '}' and stack and stack[-1] == '}':
-            stack.pop()
-        elif ch == ']' and stack and stack[-1] == ']':
-            stack.pop()
+            push(']')
+        elif stack and ch == stack[-1]:
+            pop()
     text += ''.join(reversed(stack))
     return text
 
+_fix_json_cached = lru_cache(maxsize=256)(_fix_json)
+
+def reset_parser_cache() -> None:
+    """Drop memoized repair results (for long-running processes that want bounded memory)."""
+    _repair_cached.cache_clear()
+    _fix_json_cached.cache_clear()
+
 
 # Example usage and test cases
 if __name__ == "__main__":
@@ -313,6 +491,31 @@ if __name__ == "__main__":
         # Array value with leading comma inside nested structure
         '{"outer": {"arr": [,10,20]}}',
 
+        # Comment markers inside strings must not be treated as comments
+        '{"url": "http://example.com/a//b", "note": "/* keep */", "n": 1 // count\n}',
+
+        # Otherwise valid JSON with trailing commas and ', x:' inside a string
+        '{"msg": "note, time: 10:30", "ids": [1, 2,],}',
+
+        # Glob-style unquoted value: a '/*' with no closing '*/' is not a comment
+        '{files: src/*.py, count: 2}',
+
+        # Prose with several fenced blocks: every block is returned
+        'Here are both:\n```json\n{"op": "add"}\n```\n```json\n"done"\n```',
+
+        # Integer wider than 64 bits keeps its exact value
+        '{"id": 123456789012345678901234567890}',
+
+        # NaN/Infinity are parsed as floats, not quoted as strings
+        '"{\\"a\\": NaN, \\"b\\": Infinity}"',
+
+        # A ``` mentioned inside prose before the real fenced blocks
+        'Use ``` fences.\n```json\n[1, 2]\n```\nthen\n```json\n"x"\n```',
+
+        # No brackets, but the repair still yields a scalar
+        "'hello'",
+        '42 // answer',
+
     ]
 
     for i, test in enumerate(test_cases):
@@ -337,6 +540,33 @@ if __name__ == "__main__":
             assert isinstance(result, dict), f"Test {i + 1} failed: expected dict but got {type(result)}"
             assert result.get("url") == "https://example.com"
             assert result.get("email") == "test@example.com"
+        elif i == 25:  # Test 26
+            assert isinstance(result, dict), f"Test {i + 1} failed: expected dict but got {type(result)}"
+            assert result.get("url") == "http://example.com/a//b"
+            assert result.get("note") == "/* keep */"
+            assert result.get("n") == 1
+        elif i == 26:  # Test 27
+            assert isinstance(result, dict), f"Test {i + 1} failed: expected dict but got {type(result)}"
+            assert result.get("msg") == "note, time: 10:30"
+            assert result.get("ids") == [1, 2]
+        elif i == 27:  # Test 28
+            assert isinstance(result, dict), f"Test {i + 1} failed: expected dict but got {type(result)}"
+            assert result.get("files") == "src/*.py"
+            assert result.get("count") == 2
+        elif i == 28:  # Test 29
+            assert result == [{"op": "add"}, "done"], f"Test {i + 1} failed: got {result}"
+        elif i == 29:  # Test 30
+            assert result == {"id": 123456789012345678901234567890}, f"Test {i + 1} failed: got {result}"
+        elif i == 30:  # Test 31
+            assert isinstance(result, dict), f"Test {i + 1} failed: expected dict but got {type(result)}"
+            assert result.get("a") != result.get("a")  # NaN
+            assert result.get("b") == float("inf")
+        elif i == 31:  # Test 32
+            assert result == [[1, 2], "x"], f"Test {i + 1} failed: got {result}"
+        elif i == 32:  # Test 33
+            assert result == "hello", f"Test {i + 1} failed: got {result!r}"
+        elif i == 33:  # Test 34
+            assert result == 42, f"Test {i + 1} failed: got {result!r}"
         else:
             assert isinstance(result, dict), (
                 f"Test {i + 1} failed: expected dict but got {type(result)}. Parsed value: {result}"
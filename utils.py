@@ -1,13 +1,32 @@
+from functools import lru_cache
 from typing import Any, Type, Union, get_origin, get_args
 from pydantic import BaseModel
 
 
+def _intent(t: Any) -> Union[str, None]:
+    # snippets name tool models by their intent, never by class name
+    if isinstance(t, type) and issubclass(t, BaseModel) and "intent" in t.model_fields:
+        return f'"{t.model_fields["intent"].default}"'
+    return None
+
+@lru_cache(maxsize=512)
 def _pretty(t: Any) -> str:
     origin = get_origin(t)
     if origin is Union:
-        return " | ".join(_pretty(a) for a in get_args(t))
+        args = get_args(t)
+        intents = [_intent(a) for a in args]
+        if all(intents):
+            return "{intent: " + "|".join(intents) + ", ...}"
+        return " | ".join(_pretty(a) for a in args)
+    if origin is list:
+        return f"list[{_pretty(get_args(t)[0])}]"
+    intent = _intent(t)
+    if intent:
+        return "{intent: " + intent + ", ...}"
     return getattr(t, "__name__", str(t))
 
+# the schema snippet for a model class never changes, so build it once per class
+@lru_cache(maxsize=None)
 def snippet(model: Type[BaseModel]) -> str:
     lines = [f'{{\n intent: "{model.model_fields["intent"].default}",']
     for name, field in model.model_fields.items():